@@ -1,30 +1,48 @@
 #!/usr/bin/python3
 
 import argparse
+from bisect import bisect_left, insort
 import serial
 import sys
-from queue import Queue
-from time import sleep
-import tty
-import threading
-import termios
-import fcntl
+from collections import deque
+import select
+import selectors
 import os
+import re
 import importlib.util
 from pathlib import Path
 
+if sys.platform != "win32":
+    import tty
+    import termios
+    import fcntl
+
 
 VERSION = "1.0.2"
 
 BACKSPACE = 127
 
+CLEAR_LINE = b"\r\033[2K"
+PROMPT_PREFIX = b"> "
+
 INPUT_FILTER = "serpent_input_filter"
 OUTPUT_FILTER = "serpent_output_filter"
 
+CONFIGS = {
+    f"{bytesize}{parity}{stopbits:g}": (bytesize, parity, stopbits)
+    for bytesize in serial.Serial.BYTESIZES
+    for parity in serial.Serial.PARITIES
+    for stopbits in serial.Serial.STOPBITS
+}
+
+EXTRA_ARG = re.compile(r"--([^=]+)=(.*)", re.DOTALL)
+
 
 class Prompt:
     def __init__(self, echo: bool):
         self.__fd = sys.stdin.fileno()
+        self.__out_fd = sys.stdout.fileno()
+        self.__encoding = sys.stdout.encoding
         self.__old_settings = termios.tcgetattr(self.__fd)
 
         self.__orig_fl = fcntl.fcntl(sys.stdin, fcntl.F_GETFL)
@@ -34,63 +52,104 @@ class Prompt:
 
         self.__echo = echo
         self.__prompt = ""
-        self.__output_queue = Queue()
+        self.__output_queue = deque()
         self.__history = []
+        self.__history_sorted = []
+        self.__dirty = True
 
 
     def __del__(self):
         termios.tcsetattr(self.__fd, termios.TCSADRAIN, self.__old_settings)
 
 
-    def paint(self) -> str:
+    def read(self) -> list[str]:
         """
-        Paint the prompt on the terminal and return a line of user input
-        if enter has been pressed, otherwise None.
+        Process all keys currently available on the terminal and return the
+        lines of user input completed by pressing enter.
         """
 
-        line_read = None
+        lines_read = []
 
-        c = sys.stdin.buffer.read(1)
-        if c:
-            if ord(c) == BACKSPACE and len(self.__prompt) >= 1:
+        try:
+            chunk = os.read(self.__fd, 4096)
+        except BlockingIOError:
+            chunk = b''
+        else:
+            # readable but no data means the terminal hung up
+            if not chunk:
+                raise Exception("Terminal closed")
+
+        for c in chunk:
+            if c == BACKSPACE and len(self.__prompt) >= 1:
                 self.__prompt = self.__prompt[:-1]
-            elif c == b'\n':
+                self.__dirty = True
+            elif c == ord('\n'):
                 if self.__echo:
-                    self.__output_queue.put("> " + self.__prompt)
+                    self.__output_queue.append("> " + self.__prompt)
 
-                line_read = self.__prompt
-                self.__history.append(line_read)
+                lines_read.append(self.__prompt)
+                self.__history.append(self.__prompt)
+                insort(self.__history_sorted, self.__prompt)
                 
                 self.__prompt = ""
-            elif c == b'\t':
+                self.__dirty = True
+            elif c == ord('\t'):
                 self.__autocomplete()
-            else:
-                s = str(c, "ascii")
-                if s.isprintable():
-                    self.__prompt = self.__prompt + s
+            elif c < 128 and chr(c).isprintable():
+                self.__prompt = self.__prompt + chr(c)
+                self.__dirty = True
+
+        return lines_read
+
+
+    def paint(self):
+        """
+        Paint the pending output and the prompt on the terminal if
+        anything changed since the last paint.
+        """
+
+        if not self.__dirty:
+            return None
 
         # delete prompt
-        print("\r\033[2K", end="", flush=True)
+        out = CLEAR_LINE
+
+        if self.__output_queue:
+            self.__output_queue.append("")
+            out += "\n".join(self.__output_queue).encode(self.__encoding, errors="replace")
+            self.__output_queue.clear()
 
-        if self.__output_queue.empty() == False:
-            line = self.__output_queue.get_nowait()
+        # reprint prompt, user input is always ASCII
+        out += PROMPT_PREFIX + self.__prompt.encode("ascii")
 
-            print(line)
+        self.__write(out)
 
-        # reprint prompt
-        print("\r\033[2K>", self.__prompt, end='', flush=True)
-        
-        return line_read
+        self.__dirty = False
 
 
     def print(self, line):
-        self.__output_queue.put(line)
+        self.__output_queue.append(line)
+        self.__dirty = True
+
+
+    def __write(self, data: bytes):
+        view = memoryview(data)
+        while view:
+            try:
+                n = os.write(self.__out_fd, view)
+            except BlockingIOError:
+                # stdout may share the non-blocking file description of stdin
+                select.select([], [self.__out_fd], [])
+                continue
+
+            view = view[n:]
 
 
-    def __autocomplete(self) -> str:
-        for i in range(len(self.__history) - 1, -1, -1):
-            if self.__history[i].startswith(self.__prompt):
-                self.__prompt = self.__history[i]
+    def __autocomplete(self):
+        i = bisect_left(self.__history_sorted, self.__prompt)
+        if i < len(self.__history_sorted) and self.__history_sorted[i].startswith(self.__prompt):
+            self.__prompt = self.__history_sorted[i]
+            self.__dirty = True
 
 
 class Serpent:
@@ -104,48 +163,83 @@ class Serpent:
         self.__input_filter = input_filter
         self.__output_filter = output_filter
         self.__extra_args = extra_args
-        self.__stop_event = threading.Event()
         self.__prompt = Prompt(echo)
+        self.__rxbuf = bytearray(4096)
+        self.__rxview = memoryview(self.__rxbuf)
+        self.__txbuf = bytearray()
 
 
     def run(self):
-        thread = threading.Thread(target=self.__read_serial)
-        thread.daemon = True
-        thread.start()
+        sel = selectors.DefaultSelector()
+        sel.register(sys.stdin, selectors.EVENT_READ, "stdin")
+        sel.register(self.__serial.fileno(), selectors.EVENT_READ, "serial")
+
+        buffer = bytearray()
+
+        # bind the names used on every event to locals
+        read_prompt = self.__prompt.read
+        print_line = self.__prompt.print
+        paint = self.__prompt.paint
+        read_serial = self.__read_serial
+        write = self.__serial.write
+        txbuf = self.__txbuf
+        input_filter = self.__input_filter
+        output_filter = self.__output_filter
+        extra_args = self.__extra_args
 
         try:
+            paint()
+
             while True:
-                user_input = self.__prompt.paint()
-                if user_input:
-                    cmd = self.__output_filter(user_input, self.__extra_args)
-                    if cmd:
-                        self.__serial.write(cmd)
-                
-                if self.__stop_event.is_set():
-                    raise Exception("Connection closed unexpectedly")
-                
-                sleep(0.01)
+                for key, _ in sel.select():
+                    if key.data == "stdin":
+                        for user_input in read_prompt():
+                            if user_input:
+                                cmd = output_filter(user_input, extra_args)
+                                if cmd:
+                                    txbuf += cmd
+                    else:
+                        buffer.extend(read_serial())
+
+                        lines, rest = input_filter(buffer, extra_args)
+                        if len(rest) > len(buffer):
+                            raise Exception("Input filter returned more remaining bytes than it was given")
+
+                        del buffer[:len(buffer) - len(rest)]
+
+                        for line in lines:
+                            print_line(line)
+
+                # send all commands entered during this wakeup at once
+                if txbuf:
+                    write(txbuf)
+                    txbuf.clear()
+
+                paint()
 
         except KeyboardInterrupt:
             print("r\033[2K\nTerminated")
         except Exception as ex:
             print(f"\r\033[2K\n{ex}")
+        finally:
+            sel.close()
 
 
-    def __read_serial(self):
+    def __read_serial(self) -> memoryview:
+        # read the fd directly, pyserial's read/readinto allocate a new bytes object per call
         try:
-            buffer = bytes()
-            while True:
-                buffer = buffer + self.__serial.read_all()
+            n = os.readv(self.__serial.fileno(), [self.__rxbuf])
+        except BlockingIOError:
+            # the port is opened non-blocking, nothing to read after a spurious wakeup
+            return self.__rxview[:0]
+        except OSError:
+            raise Exception("Connection closed unexpectedly")
 
-                lines, buffer = self.__input_filter(buffer, self.__extra_args)
+        # readable but no data means the device is gone
+        if n == 0:
+            raise Exception("Connection closed unexpectedly")
 
-                for line in lines:
-                    self.__prompt.print(line)
-
-                sleep(0.01)
-        except:
-            self.__stop_event.set()
+        return self.__rxview[:n]
 
 
 def __load_plugin(plugin: str) -> tuple:
@@ -171,40 +265,44 @@ def __load_plugin(plugin: str) -> tuple:
 
 
 def __parse_unknown_args(args: list[str]) -> dict:
-    extra_args = {}
+    return {m.group(1): m.group(2) for arg in args if (m := EXTRA_ARG.fullmatch(arg))}
+
 
-    for arg in args:
-        if arg.startswith("--") and "=" in arg:
-            key, value = arg[2:].split("=", 1)
-            extra_args[key] = value
+def __get_config(config: str) -> tuple[int, str, float]:
+    cfg = CONFIGS.get(config.upper())
+    if cfg is None:
+        raise Exception(f"Invalid serial configuration '{config}'")
 
-    return extra_args
+    return cfg
 
 
-def __get_config(config: str) -> tuple[int, bool, float]:
-    b = int(config[0])
-    p = config[1]
-    s = float(config[2:])
+def __text_split(data: bytes) -> tuple[list[str], int]:
+    end = data.rfind(b'\n') + 1
 
-    return (b, p, s)
+    # decode all complete lines at once, '\n' is unaffected by dropping non-ASCII bytes
+    lines = str(memoryview(data)[:end], "ascii", "ignore").split('\n')
+    lines.pop()
 
+    return lines, end
 
-def __default_text_input_filter(data: bytes, extra_args: dict) -> tuple[list[str], bytes]:
-    lines = []
 
-    while b'\n' in data:
-        pos = data.find(b'\n')
+try:
+    from _serpent_filters import text_split
+except ImportError:
+    text_split = __text_split
 
-        line = data[:pos].decode("ascii", errors="ignore")
-        lines.append(line)
 
-        data = data[pos + 1:]
+def __default_text_input_filter(data: bytearray, extra_args: dict) -> tuple[list[str], bytes]:
+    lines, end = text_split(data)
 
-    return lines, data
+    return lines, data[end:]
 
 
-def __default_binary_input_filter(data: bytes, extra_args: dict) -> tuple[list[str], bytes]:
-    return [data.hex(), bytes()]
+def __default_binary_input_filter(data: bytearray, extra_args: dict) -> tuple[list[str], bytes]:
+    if not data:
+        return [], bytes()
+
+    return [data.hex()], bytes()
 
 
 def __default_output_filter(user_input: str, extra_args: dict) -> bytes:
@@ -263,6 +361,10 @@ def main() -> int:
 
     args, unknown = parser.parse_known_args()
 
+    if sys.platform == "win32":
+        print("The serial prompt requires a POSIX terminal and is not supported on Windows")
+        return -1
+
     port = args.port
     baudrate = args.baudrate
     input_filter, output_filter = __load_plugin(args.plugin) if args.plugin is not None else __get_default_filters(args.binary)
@@ -273,7 +375,9 @@ def main() -> int:
     ser = serial.Serial()
     ser.port = port
     ser.baudrate = baudrate
-    ser.timeout = 1
+    # serial reads use os.readv on pyserial's O_NONBLOCK descriptor, this only
+    # keeps pyserial's own read() from blocking as well
+    ser.timeout = 0
     ser.dtr = 0
     ser.rts = 0
     ser.bytesize = bytesize
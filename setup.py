@@ -1,10 +1,13 @@
-from setuptools import setup
+from setuptools import setup, Extension
 
 setup(
     name="serpent",
     version="1.0.2",
     install_requires=["pyserial"],
     py_modules=["serpent"],
+    ext_modules=[
+        Extension("_serpent_filters", ["src/filters.c"], optional=True),
+    ],
     entry_points={
         "console_scripts": [
             "serpent=serpent:main",
@@ -0,0 +1,68 @@
+#define PY_SSIZE_T_CLEAN
+#include <Python.h>
+#include <string.h>
+
+/*
+ * Split the complete lines off a buffer of serial input.
+ *
+ * Returns a tuple (lines, end) where lines is the list of '\n' terminated
+ * lines decoded as ASCII (invalid bytes ignored, '\n' stripped) and end is
+ * the offset of the first byte that does not belong to a complete line.
+ */
+static PyObject *text_split(PyObject *self, PyObject *args)
+{
+    Py_buffer view;
+    if (!PyArg_ParseTuple(args, "y*:text_split", &view))
+        return NULL;
+
+    PyObject *lines = PyList_New(0);
+    if (lines == NULL) {
+        PyBuffer_Release(&view);
+        return NULL;
+    }
+
+    const char *start = view.buf;
+    const char *end = start + view.len;
+    const char *pos = start;
+    const char *nl;
+
+    while (pos < end && (nl = memchr(pos, '\n', end - pos)) != NULL) {
+        PyObject *line = PyUnicode_DecodeASCII(pos, nl - pos, "ignore");
+        if (line == NULL || PyList_Append(lines, line) < 0) {
+            Py_XDECREF(line);
+            Py_DECREF(lines);
+            PyBuffer_Release(&view);
+            return NULL;
+        }
+        Py_DECREF(line);
+        pos = nl + 1;
+    }
+
+    Py_ssize_t consumed = pos - start;
+    PyBuffer_Release(&view);
+
+    return Py_BuildValue("(Nn)", lines, consumed);
+}
+
+
+static PyMethodDef filters_methods[] = {
+    {"text_split", text_split, METH_VARARGS,
+     "text_split(data) -> (lines, end)\n\n"
+     "Split the complete lines off data and return them with the offset of the remaining bytes."},
+    {NULL, NULL, 0, NULL}
+};
+
+
+static struct PyModuleDef filters_module = {
+    PyModuleDef_HEAD_INIT,
+    "_serpent_filters",
+    "Native helpers for the default serpent input filters.",
+    -1,
+    filters_methods
+};
+
+
+PyMODINIT_FUNC PyInit__serpent_filters(void)
+{
+    return PyModule_Create(&filters_module);
+}
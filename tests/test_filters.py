@@ -0,0 +1,33 @@
+import random
+import unittest
+
+import serpent
+
+try:
+    import _serpent_filters
+except ImportError:
+    _serpent_filters = None
+
+
+py_text_split = getattr(serpent, "__text_split")
+
+
+@unittest.skipIf(_serpent_filters is None, "_serpent_filters extension is not built")
+class TextSplitTest(unittest.TestCase):
+    """
+    The C helper and the pure-Python fallback must split identically.
+    """
+
+    def test_matches_python_fallback(self):
+        rng = random.Random(0)
+        alphabet = b"\n\r\x00\x7f\x80\xff" + bytes(range(0x20, 0x7f))
+
+        for _ in range(20000):
+            data = bytes(rng.choice(alphabet) for _ in range(rng.randrange(64)))
+
+            for buf in (data, bytearray(data)):
+                self.assertEqual(_serpent_filters.text_split(buf), py_text_split(buf), buf)
+
+
+if __name__ == "__main__":
+    unittest.main()